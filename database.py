@@ -1,15 +1,16 @@
 """
 Database Helper Functions
 
-MongoDB helper functions ready to use in your backend code.
-Import and use these functions in your API endpoints for database operations.
+Async MongoDB (Motor) helper functions ready to use in your backend code.
+Import and await these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,34 +23,86 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url)
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-
-    # Convert Pydantic model to dict if needed
+def _prepare_document(data: Union[BaseModel, dict], now: datetime) -> dict:
+    # Already-validated models are dumped exactly once; dicts are copied so the caller's is untouched
     if isinstance(data, BaseModel):
-        data_dict = data.model_dump()
+        data_dict = data.model_dump(exclude_none=True)
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
+    return data_dict
+
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    data_dict = _prepare_document(data, datetime.now(timezone.utc))
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]]):
+    """Insert many documents with timestamps in a single round-trip.
+
+    Returns (inserted ids, failures) where each failure is {"index", "detail"} for an item that was not written.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    if not items:
+        return [], []
+
+    now = datetime.now(timezone.utc)
+    docs = [_prepare_document(item, now) for item in items]
+
+    # unordered: the server may apply the batch in any order and keeps going past failures
+    failed = {}
+    try:
+        await db[collection_name].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+
+    # insert_many assigns each doc its _id client-side, so the survivors are known without a re-read
+    inserted_ids = [str(doc["_id"]) for i, doc in enumerate(docs) if i not in failed]
+    failures = [{"index": i, "detail": detail} for i, detail in sorted(failed.items())]
+    return inserted_ids, failures
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None, sort: list = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit)
+
+async def get_documents_with_id(collection_name: str, filter_dict: dict = None, limit: int = None, sort: list = None, fields: List[str] = None):
+    """Get documents from collection with `_id` exposed as a string `id` field.
+
+    If `fields` is given, only those keys are returned, and every one is present (null when the document lacks it).
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    pipeline = [{"$match": filter_dict or {}}]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    if limit:
+        pipeline.append({"$limit": limit})
+    if fields:
+        pipeline.append({"$project": {"_id": 0, "id": {"$toString": "$_id"}, **{f: {"$ifNull": [f"${f}", None]} for f in fields}}})
+    else:
+        pipeline.append({"$addFields": {"id": {"$toString": "$_id"}}})
+        pipeline.append({"$project": {"_id": 0}})
+
+    return await db[collection_name].aggregate(pipeline).to_list(length=None)
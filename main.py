@@ -1,38 +1,184 @@
 import os
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import anyio.to_thread
+import bcrypt
+from bson import ObjectId
+from bson.errors import InvalidId
+from cachetools import TTLCache
+from fastapi import Body, Depends, FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 
-from database import db, create_document, get_documents
+from database import db, create_document, create_documents, get_documents_with_id
 from schemas import User, ContentItem, Task, Checkin, Squad, Post, Program, Enrollment, Feedback
 
-app = FastAPI(title="Life Moves API", version="0.1.0")
+logger = logging.getLogger(__name__)
+
+
+# Collection handles, bound once instead of resolving db[name] per request
+def collection(name: str):
+    return db[name] if db is not None else None
+
+
+USERS = collection("user")
+CONTENT = collection("contentitem")
+TASKS = collection("task")
+CHECKINS = collection("checkin")
+SQUADS = collection("squad")
+POSTS = collection("post")
+ENROLLMENTS = collection("enrollment")
+
+THREADPOOL_TOKENS = int(os.getenv("THREADPOOL_TOKENS", "200"))
+
+
+def configure_threadpool():
+    # Work dispatched through AnyIO (sync deps, run_in_threadpool) shares its default
+    # limiter of 40 tokens; widen it. AnyIO 3 runs that work on its own threads, so the
+    # loop's default executor only serves direct run_in_executor(None, ...) calls. None of
+    # this changes DB concurrency: Motor uses a private executor sized by MOTOR_MAX_WORKERS
+    # (default 5 x CPU), which caps concurrent Mongo operations per worker.
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = THREADPOOL_TOKENS
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREADPOOL_TOKENS))
+
+
+# Only the bcrypt hashing in signup/login borrows AnyIO thread tokens (Motor runs its
+# queries on its own executor), so this measures password-hashing backlog: once most
+# tokens are taken, auth requests get a fast 429 instead of queueing behind bcrypt
+THREADPOOL_SHED_THRESHOLD = int(os.getenv("THREADPOOL_SHED_THRESHOLD", str(THREADPOOL_TOKENS * 9 // 10)))
+
+
+async def shed_load():
+    if anyio.to_thread.current_default_thread_limiter().borrowed_tokens >= THREADPOOL_SHED_THRESHOLD:
+        raise HTTPException(status_code=429, detail="Server busy, retry shortly")
+
+
+async def ensure_indexes():
+    # One index per filter shape used by the list endpoints
+    await asyncio.gather(
+        CONTENT.create_index([("title", "text"), ("description", "text")]),
+        TASKS.create_index([("user_id", 1), ("week", 1)]),
+        CHECKINS.create_index([("user_id", 1), ("date", -1)]),
+        POSTS.create_index([("squad_id", 1), ("created_at", -1)]),
+        POSTS.create_index([("user_id", 1), ("created_at", -1)]),
+        ENROLLMENTS.create_index([("user_id", 1), ("_id", 1)]),
+        SQUADS.create_index([("members", 1), ("_id", 1)]),
+        ensure_unique_email_index(),
+    )
+
+
+async def ensure_unique_email_index():
+    # Databases written by the old check-then-insert signup may already hold duplicate
+    # emails; don't take every worker down over it, signup still checks before inserting
+    try:
+        await USERS.create_index([("email", 1)], unique=True)
+    except DuplicateKeyError:
+        logger.warning("user.email has duplicate values; dedupe the user collection so the unique index can be built")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process before it accepts requests, so the first
+    # request doesn't pay for index builds and a bad DATABASE_URL fails at boot
+    configure_threadpool()
+    if db is not None:
+        await db.command({"ping": 1})
+        await ensure_indexes()
+    yield
+
+
+app = FastAPI(title="Life Moves API", version="0.1.0", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Comma-separated explicit origins; credentials are only allowed with an explicit list
+# (a "*" wildcard combined with credentials is invalid per the CORS spec)
+ALLOWED_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "*").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials="*" not in ALLOWED_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+
 # Utility
 class IdResponse(BaseModel):
     id: str
 
 
-def collection(name: str):
-    return db[name]
+class BulkFailure(BaseModel):
+    index: int
+    detail: str
+
+
+class IdsResponse(BaseModel):
+    ids: List[str]
+    failed: List[BulkFailure] = Field(default_factory=list)
+
+
+# Response shapes for list endpoints: the schema fields, each always present (null if
+# unset, since create_document skips None values), so old and new documents look alike
+CONTENT_FIELDS = list(ContentItem.model_fields)
+PROGRAM_FIELDS = list(Program.model_fields)
+TASK_FIELDS = [*Task.model_fields, "created_at", "updated_at"]
+CHECKIN_FIELDS = [*Checkin.model_fields, "created_at", "updated_at"]
+POST_FIELDS = [*Post.model_fields, "updated_at"]
+
+
+# Keyset pagination: `after` is an opaque cursor wrapping the last _id of the previous page
+def _encode_cursor(doc_id: str) -> str:
+    return base64.urlsafe_b64encode(bytes.fromhex(doc_id)).decode().rstrip("=")
+
+
+def _decode_cursor(after: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(after + "=" * (-len(after) % 4)))
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _paginate(filt: dict, after: Optional[str]) -> dict:
+    if after:
+        filt["_id"] = {"$gt": _decode_cursor(after)}
+    return filt
+
+
+def _page(items: list, limit: int) -> dict:
+    next_cursor = _encode_cursor(items[-1]["id"]) if len(items) == limit else None
+    return {"items": items, "next": next_cursor}
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"name": "Life Moves API", "status": "ok"}
 
 
+# Env config is fixed for the life of the process; the DB probe is cached briefly so a
+# frequent load-balancer healthcheck costs one Mongo round-trip per 5s, not one per hit
+DATABASE_URL_FLAG = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
+DATABASE_NAME_FLAG = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+_health_cache = TTLCache(maxsize=1, ttl=5)
+
+
 @app.get("/test")
-def test_database():
+async def test_database():
+    cached = _health_cache.get("test")
+    if cached is not None:
+        return cached
+
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -45,21 +191,47 @@ def test_database():
     try:
         if db is not None:
             response["database"] = "✅ Available"
-            response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-            response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+            response["database_url"] = DATABASE_URL_FLAG
+            response["database_name"] = DATABASE_NAME_FLAG
             response["connection_status"] = "Connected"
             try:
-                response["collections"] = db.list_collection_names()[:10]
+                response["collections"] = (await db.list_collection_names())[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️ Connected but Error: {str(e)[:80]}"
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:80]}"
 
+    _health_cache["test"] = response
     return response
 
 
-# Auth (MVP: email + simple session token stored in user document)
+# Auth (MVP: email + bcrypt password hash + session token stored in user document)
+BCRYPT_ROUNDS = 12
+
+# Recently verified (email, password) pairs -> the bcrypt hash they matched, so a
+# burst of logins for the same user pays bcrypt's cost once. Keys are HMACed with
+# a per-process secret so plaintext passwords never sit in memory.
+_login_cache = TTLCache(maxsize=1024, ttl=300)
+_login_cache_secret = secrets.token_bytes(32)
+
+
+def _login_cache_key(email: str, password: str):
+    return email, hmac.new(_login_cache_secret, password.encode(), hashlib.sha256).hexdigest()
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode(), password_hash.encode())
+    except ValueError:
+        # not a bcrypt hash (e.g. legacy MVP records)
+        return False
+
+
 class SignupRequest(BaseModel):
     name: str
     email: str
@@ -71,167 +243,246 @@ class LoginRequest(BaseModel):
     password: str
 
 
-@app.post("/auth/signup", response_model=IdResponse)
-def signup(payload: SignupRequest):
-    if not db:
+@app.post("/auth/signup", response_model=IdResponse, dependencies=[Depends(shed_load)])
+async def signup(payload: SignupRequest):
+    if db is None:
         raise HTTPException(status_code=500, detail="Database unavailable")
-    existing = collection("user").find_one({"email": payload.email})
+    existing = await USERS.find_one({"email": payload.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    # Simple hash substitute for MVP (NOT for production)
-    password_hash = f"sha1::{abs(hash(payload.password))}"
+    password_hash = await run_in_threadpool(hash_password, payload.password)
     user = User(name=payload.name, email=payload.email, password_hash=password_hash)
-    new_id = create_document("user", user)
+    try:
+        new_id = await create_document("user", user)
+    except DuplicateKeyError:
+        # a concurrent signup for the same email won the race past the check above
+        raise HTTPException(status_code=400, detail="Email already registered")
     return {"id": new_id}
 
 
-@app.post("/auth/login")
-def login(payload: LoginRequest):
-    u = collection("user").find_one({"email": payload.email})
-    if not u:
-        raise HTTPException(status_code=404, detail="User not found")
-    expected = u.get("password_hash")
-    if expected != f"sha1::{abs(hash(payload.password))}":
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    # naive session token
-    token = f"tok_{abs(hash(payload.email + payload.password))}"
-    collection("user").update_one({"_id": u["_id"]}, {"$set": {"session_token": token}})
+@app.post("/auth/login", dependencies=[Depends(shed_load)])
+async def login(payload: LoginRequest):
+    token = secrets.token_urlsafe(32)
+    update = {"$set": {"session_token": token}}
+    projection = {"name": 1, "email": 1, "plan": 1}
+    cache_key = _login_cache_key(payload.email, payload.password)
+    u = None
+    verified_hash = _login_cache.get(cache_key)
+    if verified_hash:
+        # Password already checked against this hash: matching on it in the filter finds
+        # the user and stores the token in one round-trip (None if the hash has changed)
+        u = await USERS.find_one_and_update({"email": payload.email, "password_hash": verified_hash}, update,
+                                            projection=projection, return_document=ReturnDocument.AFTER)
+    if u is None:
+        found = await USERS.find_one({"email": payload.email}, {"password_hash": 1})
+        if not found:
+            raise HTTPException(status_code=404, detail="User not found")
+        expected = found.get("password_hash") or ""
+        if not await run_in_threadpool(verify_password, payload.password, expected):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        _login_cache[cache_key] = expected
+        u = await USERS.find_one_and_update({"_id": found["_id"], "password_hash": expected}, update,
+                                            projection=projection, return_document=ReturnDocument.AFTER)
+        if u is None:
+            # password changed between the read and the update
+            raise HTTPException(status_code=401, detail="Invalid credentials")
     return {"token": token, "user": {"id": str(u["_id"]), "name": u.get("name"), "email": u.get("email"), "plan": u.get("plan", "free")}}
 
 
+# Catalog cache: library and program listings are shared by every user and rarely
+# change, so keep them per worker for a short TTL. Writes bump the collection's
+# version, which is part of every key, so stale entries are never read again.
+_catalog_cache = TTLCache(maxsize=1024, ttl=60)
+_catalog_versions = {"contentitem": 0, "program": 0}
+
+
+def _catalog_key(collection_name: str, *params):
+    return (collection_name, _catalog_versions[collection_name]) + tuple(p or "" for p in params)
+
+
+def _invalidate_catalog(collection_name: str):
+    _catalog_versions[collection_name] += 1
+
+
 # Library endpoints
-@app.get("/library", response_model=List[ContentItem])
-def list_content(category: Optional[str] = None, q: Optional[str] = None, tier: Optional[str] = None):
+@app.get("/library")
+async def list_content(category: Optional[str] = None, q: Optional[str] = None, tier: Optional[str] = None,
+                       limit: int = Query(50, ge=1, le=500), after: Optional[str] = None):
+    # $text already tokenizes multi-keyword queries, so only normalize whitespace
+    terms = " ".join(q.split()) if q else ""
+    if terms and after:
+        raise HTTPException(status_code=400, detail="Search results are a single page; `after` cannot be combined with `q`")
+    # only first pages are cached, so made-up cursors can't fill the cache
+    key = _catalog_key("contentitem", category, tier, terms, limit) if not after else None
+    cached = _catalog_cache.get(key) if key else None
+    if cached is not None:
+        return ORJSONResponse(cached)
+
     filt = {}
     if category:
         filt["category"] = category
     if tier:
         filt["tier"] = tier
-    items = get_documents("contentitem", filt)  # ContentItem -> collection "contentitem"
-    # simple search filter
-    if q:
-        ql = q.lower()
-        items = [i for i in items if ql in i.get("title", "").lower() or ql in (i.get("description", "").lower())]
-    # remove _id for clean response
-    for i in items:
-        i.pop("_id", None)
-    return items
+    # search title/description through the text index and return the best `limit`
+    # matches; relevance order has no keyset, so search results are a single page
+    if terms:
+        filt["$text"] = {"$search": terms}
+        items = await get_documents_with_id("contentitem", filt, limit=limit, sort=[("score", {"$meta": "textScore"})],
+                                            fields=CONTENT_FIELDS)
+        page = {"items": items, "next": None}
+    else:
+        items = await get_documents_with_id("contentitem", _paginate(filt, after), limit=limit, sort=[("_id", 1)],
+                                            fields=CONTENT_FIELDS)
+        page = _page(items, limit)
+    if key:
+        _catalog_cache[key] = page
+    return ORJSONResponse(page)
 
 
 @app.post("/library", response_model=IdResponse)
-def add_content(item: ContentItem):
-    new_id = create_document("contentitem", item)
+async def add_content(item: ContentItem):
+    new_id = await create_document("contentitem", item)
+    _invalidate_catalog("contentitem")
     return {"id": new_id}
 
 
+@app.post("/library/bulk", response_model=IdsResponse)
+async def add_content_bulk(items: List[ContentItem] = Body(..., max_length=500)):
+    try:
+        new_ids, failed = await create_documents("contentitem", items)
+    finally:
+        # part of the batch may be written even when the call fails
+        _invalidate_catalog("contentitem")
+    return {"ids": new_ids, "failed": failed}
+
+
 # Progress: weekly tasks
 @app.post("/tasks", response_model=IdResponse)
-def submit_task(task: Task):
-    new_id = create_document("task", task)
+async def submit_task(task: Task):
+    new_id = await create_document("task", task)
     return {"id": new_id}
 
 
+@app.post("/tasks/bulk", response_model=IdsResponse)
+async def submit_tasks_bulk(tasks: List[Task] = Body(..., max_length=500)):
+    new_ids, failed = await create_documents("task", tasks)
+    return {"ids": new_ids, "failed": failed}
+
+
 @app.get("/tasks")
-def list_tasks(user_id: str, week: Optional[str] = None):
+async def list_tasks(user_id: str, week: Optional[str] = None):
     filt = {"user_id": user_id}
     if week:
         filt["week"] = week
-    tasks = get_documents("task", filt)
-    for t in tasks:
-        t["id"] = str(t.pop("_id")) if t.get("_id") else None
-    return tasks
+    return ORJSONResponse(await get_documents_with_id("task", filt, fields=TASK_FIELDS))
 
 
 # Daily check-ins
 @app.post("/checkins", response_model=IdResponse)
-def create_checkin(checkin: Checkin):
-    new_id = create_document("checkin", checkin)
+async def create_checkin(checkin: Checkin):
+    new_id = await create_document("checkin", checkin)
     return {"id": new_id}
 
 
 @app.get("/checkins")
-def list_checkins(user_id: str, limit: int = 30):
-    docs = get_documents("checkin", {"user_id": user_id}, limit=limit)
-    for d in docs:
-        d["id"] = str(d.pop("_id")) if d.get("_id") else None
-    return docs
+async def list_checkins(user_id: str, limit: int = Query(30, ge=1, le=500)):
+    docs = await get_documents_with_id("checkin", {"user_id": user_id}, limit=limit, sort=[("date", -1)],
+                                       fields=CHECKIN_FIELDS)
+    return ORJSONResponse(docs)
 
 
 # Squads & posts (community basics)
 @app.post("/squads", response_model=IdResponse)
-def create_squad(squad: Squad):
+async def create_squad(squad: Squad):
     if squad.owner_id not in squad.members:
         squad.members.append(squad.owner_id)
-    new_id = create_document("squad", squad)
+    new_id = await create_document("squad", squad)
     return {"id": new_id}
 
 
 @app.get("/squads")
-def list_squads(member_id: Optional[str] = None):
-    filt = {"members": {"$in": [member_id]}} if member_id else {}
-    docs = get_documents("squad", filt)
-    for d in docs:
-        d["id"] = str(d.pop("_id")) if d.get("_id") else None
-    return docs
+async def list_squads(member_id: Optional[str] = None, limit: int = Query(50, ge=1, le=500), after: Optional[str] = None):
+    # equality on an array field matches any element and hits the multikey index
+    filt = {"members": member_id} if member_id else {}
+    items = await get_documents_with_id("squad", _paginate(filt, after), limit=limit, sort=[("_id", 1)],
+                                        fields=["name", "description", "owner_id", "members"])
+    return ORJSONResponse(_page(items, limit))
 
 
 @app.post("/posts", response_model=IdResponse)
-def create_post(post: Post):
-    new_id = create_document("post", post)
+async def create_post(post: Post):
+    new_id = await create_document("post", post)
     return {"id": new_id}
 
 
 @app.get("/posts")
-def list_posts(squad_id: Optional[str] = None, user_id: Optional[str] = None, limit: int = 50):
+async def list_posts(squad_id: Optional[str] = None, user_id: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
     filt = {}
     if squad_id:
         filt["squad_id"] = squad_id
     if user_id:
         filt["user_id"] = user_id
-    docs = get_documents("post", filt, limit=limit)
-    for d in docs:
-        d["id"] = str(d.pop("_id")) if d.get("_id") else None
-    return docs
+    docs = await get_documents_with_id("post", filt, limit=limit, sort=[("created_at", -1)], fields=POST_FIELDS)
+    return ORJSONResponse(docs)
 
 
 # Programs & enrollments
 @app.post("/programs", response_model=IdResponse)
-def create_program(program: Program):
-    new_id = create_document("program", program)
+async def create_program(program: Program):
+    new_id = await create_document("program", program)
+    _invalidate_catalog("program")
     return {"id": new_id}
 
 
-@app.get("/programs", response_model=List[Program])
-def list_programs(tier: Optional[str] = None):
+@app.get("/programs")
+async def list_programs(tier: Optional[str] = None, limit: int = Query(50, ge=1, le=500), after: Optional[str] = None):
+    # only first pages are cached, so made-up cursors can't fill the cache
+    key = _catalog_key("program", tier, limit) if not after else None
+    cached = _catalog_cache.get(key) if key else None
+    if cached is not None:
+        return ORJSONResponse(cached)
+
     filt = {"tier": tier} if tier else {}
-    docs = get_documents("program", filt)
-    for d in docs:
-        d.pop("_id", None)
-    return docs
+    docs = await get_documents_with_id("program", _paginate(filt, after), limit=limit, sort=[("_id", 1)],
+                                       fields=PROGRAM_FIELDS)
+    page = _page(docs, limit)
+    if key:
+        _catalog_cache[key] = page
+    return ORJSONResponse(page)
 
 
 @app.post("/enroll", response_model=IdResponse)
-def enroll_user(enrollment: Enrollment):
-    new_id = create_document("enrollment", enrollment)
+async def enroll_user(enrollment: Enrollment):
+    new_id = await create_document("enrollment", enrollment)
     return {"id": new_id}
 
 
 @app.get("/enrollments")
-def list_enrollments(user_id: str):
-    docs = get_documents("enrollment", {"user_id": user_id})
-    for d in docs:
-        d["id"] = str(d.pop("_id")) if d.get("_id") else None
-    return docs
+async def list_enrollments(user_id: str, limit: int = Query(50, ge=1, le=500), after: Optional[str] = None):
+    filt = _paginate({"user_id": user_id}, after)
+    docs = await get_documents_with_id("enrollment", filt, limit=limit, sort=[("_id", 1)])
+    return ORJSONResponse(_page(docs, limit))
 
 
 # Feedback
 @app.post("/feedback", response_model=IdResponse)
-def submit_feedback(feedback: Feedback):
-    new_id = create_document("feedback", feedback)
+async def submit_feedback(feedback: Feedback):
+    new_id = await create_document("feedback", feedback)
     return {"id": new_id}
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # An import string (not the app object) is required when workers > 1
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=int(os.getenv("UVICORN_WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+        # per-worker cap: excess connections get a fast 503 instead of queueing
+        limit_concurrency=int(os.getenv("UVICORN_LIMIT_CONCURRENCY", "1000")),
+        backlog=2048,
+    )